@@ -1,16 +1,126 @@
+import asyncio
+import atexit
+import hashlib
+import heapq
 import json
+import os
 import re
+import shelve
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, List, Optional
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 
+import httpx
+import numpy as np
 import ollama
-import pandas as pd
+import requests
 import spotipy
-from fuzzywuzzy import fuzz
-from Levenshtein import jaro_winkler
+from rapidfuzz import fuzz, process
+from rapidfuzz.distance import JaroWinkler
+from requests.adapters import HTTPAdapter
 from spotipy.oauth2 import SpotifyClientCredentials
+from urllib3.util.retry import Retry
 from ytmusicapi import YTMusic
 
+if TYPE_CHECKING:
+    import pandas as pd
+
+_NON_ALNUM_RE = re.compile(r"[^a-z0-9]")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+# One keep-alive pool shared by every MusicMatcher so LLM calls skip the
+# per-request TCP handshake against `ollama serve`.
+OLLAMA_TIMEOUT = httpx.Timeout(300.0, connect=10.0)
+OLLAMA_LIMITS = httpx.Limits(max_keepalive_connections=40, keepalive_expiry=30)
+OLLAMA_CLIENT = ollama.Client(
+    timeout=OLLAMA_TIMEOUT,
+    transport=httpx.HTTPTransport(retries=3, limits=OLLAMA_LIMITS),
+)
+# Matchers run tracks on worker threads and all share OLLAMA_CLIENT, so in-flight
+# LLM calls are capped here, at what the server decodes in parallel.
+OLLAMA_NUM_PARALLEL = int(os.getenv("OLLAMA_NUM_PARALLEL", "4"))
+OLLAMA_SLOTS = threading.BoundedSemaphore(OLLAMA_NUM_PARALLEL)
+
+# API clients are cached per credential so matchers created from worker
+# threads reuse the parsed auth and warm connection pool.
+_CLIENT_LOCK = threading.Lock()
+_SPOTIFY_CLIENTS: Dict[Tuple[str, str], spotipy.Spotify] = {}
+_YTMUSIC_CLIENTS: Dict[str, YTMusic] = {}
+
+
+def _pooled_session(pool_size: int = 16) -> requests.Session:
+    # Mirrors spotipy's own retry policy, which is lost once we pass a session.
+    retry = Retry(
+        total=3,
+        backoff_factor=0.3,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=None,
+    )
+    session = requests.Session()
+    session.mount(
+        "https://",
+        HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry),
+    )
+    return session
+
+
+def get_spotify_client(client_id: str, client_secret: str) -> spotipy.Spotify:
+    with _CLIENT_LOCK:
+        key = (client_id, client_secret)
+        if key not in _SPOTIFY_CLIENTS:
+            credentials = SpotifyClientCredentials(client_id, client_secret)
+            _SPOTIFY_CLIENTS[key] = spotipy.Spotify(
+                auth_manager=credentials, requests_session=_pooled_session()
+            )
+        return _SPOTIFY_CLIENTS[key]
+
+
+def get_ytmusic_client(auth_path: str) -> YTMusic:
+    with _CLIENT_LOCK:
+        if auth_path not in _YTMUSIC_CLIENTS:
+            _YTMUSIC_CLIENTS[auth_path] = YTMusic(
+                auth=auth_path, requests_session=_pooled_session()
+            )
+        return _YTMUSIC_CLIENTS[auth_path]
+
+
+class DiskCache:
+    """Thread-safe shelve store whose entries expire after max_age seconds."""
+
+    def __init__(self, path: str):
+        self._shelf = shelve.open(path)
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    def get(self, key: str, max_age: float):
+        with self._lock:
+            entry = self._shelf.get(key)
+        if entry is None:
+            return None
+        stored_at, value = entry
+        return value if time.time() - stored_at <= max_age else None
+
+    def set(self, key: str, value) -> None:
+        with self._lock:
+            self._shelf[key] = (time.time(), value)
+
+    def close(self) -> None:
+        with self._lock:
+            self._shelf.close()
+
+
+_DISK_CACHES: Dict[str, DiskCache] = {}
+
+
+def get_disk_cache(path: str) -> DiskCache:
+    with _CLIENT_LOCK:
+        if path not in _DISK_CACHES:
+            _DISK_CACHES[path] = DiskCache(path)
+        return _DISK_CACHES[path]
+
 
 class MusicMatcher:
     # Scoring Weights & Thresholds
@@ -19,8 +129,47 @@ class MusicMatcher:
     DURATION_WEIGHT = 0.2
     LLM_SCORE_THRESHOLD = 85
     LLM_SCORE_DIFFERENCE = 15
+    DUPLICATE_SCORE_MARGIN = 5
     MAX_YOUTUBE_RESULTS = 10
     OLLAMA_MODEL = "gemma3:12b"
+    OLLAMA_KEEP_ALIVE = -1  # keep the model resident between tracks
+    MAX_QUERY_CHARS = 120
+    PLAYLIST_PAGE_WORKERS = 8
+    MATCH_CONCURRENCY = 8
+    CACHE_TTL = 30 * 24 * 3600
+    LLM_CACHE_ENABLED = True
+    QUERY_NOISE_KEYWORDS = (
+        "remaster",
+        "deluxe",
+        "live",
+        "version",
+        "edit",
+        "mix",
+        "bonus",
+    )
+    QUERY_PROMPT_TEMPLATE = (
+        "Generate the most effective YouTube Music search query for:\n"
+        "Track: {track}\n"
+        "Artists: {artists}\n"
+        "Album: {album}\n"
+        "Duration: {duration}s\n"
+        "ISRC: {isrc}\n"
+        "Respond ONLY with the query."
+    )
+    JUDGE_PROMPT_TEMPLATE = (
+        "Pick the YouTube candidate that is the same recording as the Spotify track. "
+        "Give its 'index' (0-{max_index}) and your 'confidence' (0-100).\n"
+        "Spotify (title|artist|duration|album): {track}|{artist}|{duration}s|{album}\n"
+        "Candidates (index|title|artist|duration|album):\n{candidates}"
+    )
+    JUDGE_SCHEMA = {
+        "type": "object",
+        "properties": {
+            "index": {"type": "integer"},
+            "confidence": {"type": "integer"},
+        },
+        "required": ["index", "confidence"],
+    }
 
     def __init__(
         self,
@@ -28,18 +177,29 @@ class MusicMatcher:
         spotify_client_secret: str,
         ytmusic_auth_path: str = "browser.json",
         debug: bool = False,
+        cache_path: str = ".ytm_cache",
     ):
-        self.spotify = self._init_spotify(spotify_client_id, spotify_client_secret)
-        self.ytmusic = YTMusic(auth=ytmusic_auth_path)
+        self.spotify = get_spotify_client(spotify_client_id, spotify_client_secret)
+        self.ytmusic = get_ytmusic_client(ytmusic_auth_path)
+        self.cache = get_disk_cache(cache_path)
+        self.llm = OLLAMA_CLIENT
+        # Shared with every matcher, like the client it guards.
+        self._llm_slots = OLLAMA_SLOTS
         self.debug = debug
         self.logs: List[Dict] = []
 
-    # === Auth / Client Setup ===
-
-    @staticmethod
-    def _init_spotify(client_id: str, client_secret: str) -> spotipy.Spotify:
-        credentials = SpotifyClientCredentials(client_id, client_secret)
-        return spotipy.Spotify(auth_manager=credentials)
+    def prewarm_llm(self) -> bool:
+        """Load the Ollama model before the first match; False if the server failed."""
+        # An empty prompt loads the model without generating anything. This can
+        # block for a cold load, so callers opt in rather than paying it in __init__.
+        try:
+            self.llm.generate(
+                model=self.OLLAMA_MODEL, prompt="", keep_alive=self.OLLAMA_KEEP_ALIVE
+            )
+            return True
+        except Exception as e:
+            self._log_debug(f"LLM prewarm failed: {e}")
+            return False
 
     # === Logging ===
 
@@ -49,152 +209,348 @@ class MusicMatcher:
         if divider:
             message = f"\n{'=' * 50}\n{message}\n{'=' * 50}"
         print(message)
-        self.logs.append({"timestamp": datetime.now(), "message": message})
+        # Raw epoch seconds; converted to datetimes only when logs are read.
+        self.logs.append({"timestamp": time.time(), "message": message})
+
+    def get_debug_logs(self) -> "pd.DataFrame":
+        # pandas is only needed here; importing it lazily keeps startup light.
+        import pandas as pd
 
-    def get_debug_logs(self) -> pd.DataFrame:
-        return pd.DataFrame(self.logs)
+        logs = pd.DataFrame(self.logs, columns=["timestamp", "message"])
+        logs["timestamp"] = logs["timestamp"].map(datetime.fromtimestamp)
+        return logs
 
     # === Track Matching ===
 
-    def match_tracks(self, spotify_track: Dict, youtube_results: List[Dict]) -> Dict:
+    def match_playlist(
+        self, playlist_id: str, market: Optional[str] = None
+    ) -> Dict[str, Optional[Dict]]:
+        """Match every track in a Spotify playlist, keyed by Spotify track ID."""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.match_playlist_async(playlist_id, market))
+        # Jupyter already runs an event loop on this thread, and asyncio.run
+        # refuses to nest, so drive a fresh loop from a helper thread instead.
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(
+                lambda: asyncio.run(self.match_playlist_async(playlist_id, market))
+            ).result()
+
+    async def match_playlist_async(
+        self, playlist_id: str, market: Optional[str] = None
+    ) -> Dict[str, Optional[Dict]]:
+        loop = asyncio.get_running_loop()
+        track_ids = await loop.run_in_executor(
+            None, self.get_playlist_tracks, playlist_id, market
+        )
+        spotify_tracks = await loop.run_in_executor(
+            None, self.get_tracks, track_ids, market
+        )
+
+        # Each track is a chain of blocking Ollama/YTMusic calls; overlap them
+        # across tracks on a dedicated pool sized so neither service is flooded.
+        with ThreadPoolExecutor(max_workers=self.MATCH_CONCURRENCY) as executor:
+            results = await asyncio.gather(
+                *(
+                    loop.run_in_executor(executor, self.match_track, t)
+                    for t in spotify_tracks
+                ),
+                return_exceptions=True,
+            )
+
+        matches: Dict[str, Optional[Dict]] = {}
+        for spotify_track, result in zip(spotify_tracks, results):
+            if isinstance(result, Exception):
+                self._log_debug(f"Matching failed for {spotify_track['name']}: {result}")
+                result = None
+            matches[spotify_track["id"]] = result
+        return matches
+
+    def match_track(self, spotify_track: Dict, top_k: int = 3) -> Optional[Dict]:
+        """Search YouTube Music for a Spotify track and return the best result."""
+        track_id = spotify_track.get("id")
+        match_key = f"match:{track_id}" if track_id else None
+        if match_key:
+            cached_match = self.cache.get(match_key, self.CACHE_TTL)
+            if cached_match is not None:
+                return cached_match
+
+        query = self.generate_search_query(spotify_track)
+        youtube_results = self.search_youtube(query)
+        if not youtube_results:
+            self._log_debug(f"No YouTube results for query: {query}")
+            return None
+
+        match, verified = self._select_match(spotify_track, youtube_results, top_k)
+        # A fallback taken because the LLM was unavailable is only a guess, so
+        # it is retried on the next run instead of pinned for CACHE_TTL.
+        if match_key and verified:
+            self.cache.set(match_key, match)
+        return match
+
+    def search_youtube(self, query: str) -> List[Dict]:
+        """Search YouTube Music songs, served from the on-disk cache when fresh."""
+        normalized = " ".join(query.casefold().split())
+        key = f"search:{self.MAX_YOUTUBE_RESULTS}:{normalized}"
+        results = self.cache.get(key, self.CACHE_TTL)
+        if results is None:
+            results = self.ytmusic.search(
+                query, filter="songs", limit=self.MAX_YOUTUBE_RESULTS
+            )
+            if results:
+                self.cache.set(key, results)
+        return results
+
+    def match_tracks(
+        self, spotify_track: Dict, youtube_results: List[Dict], top_k: int = 3
+    ) -> Dict:
         """Match a Spotify track with the best YouTube Music result."""
+        return self._select_match(spotify_track, youtube_results, top_k)[0]
+
+    def _select_match(
+        self, spotify_track: Dict, youtube_results: List[Dict], top_k: int
+    ) -> Tuple[Dict, bool]:
+        """Best result, and whether it was decided by score or a successful LLM call."""
         sp_title = self._normalize_text(spotify_track["name"])
         sp_artist = self._normalize_text(spotify_track["artists"][0]["name"])
         sp_duration = spotify_track["duration_ms"] // 1000
 
-        self._log_debug(
-            f"MATCHING: {spotify_track['name']} by {spotify_track['artists'][0]['name']} ({sp_duration}s)",
-            divider=True,
-        )
+        if self.debug:
+            self._log_debug(
+                f"MATCHING: {spotify_track['name']} by {spotify_track['artists'][0]['name']} ({sp_duration}s)",
+                divider=True,
+            )
 
-        scored = [
-            self._score_match(sp_title, sp_artist, sp_duration, yt)
-            for yt in youtube_results
-        ]
-        scored.sort(reverse=True, key=lambda x: x[0])
-        top_candidates = [track for _, track in scored[:3]]
+        scored = self._score_candidates(
+            sp_title, sp_artist, sp_duration, youtube_results
+        )
+        # Only the best few feed the LLM fallback, so avoid a full sort.
+        scored = heapq.nlargest(max(2, top_k), scored, key=lambda x: x[0])
+        top_candidates = [track for _, track in scored[:top_k]]
 
-        self._log_debug("TOP MATCHES:")
-        for idx, (score, track) in enumerate(scored[:3], 1):
-            self._log_debug(f"{idx}. {track.get('title')} - Score: {score:.1f}")
+        if self.debug:
+            self._log_debug("TOP MATCHES:")
+            for idx, (score, track) in enumerate(scored[:top_k], 1):
+                self._log_debug(f"{idx}. {track.get('title')} - Score: {score:.1f}")
 
         # LLM fallback
         top_score = scored[0][0]
         second_score = scored[1][0] if len(scored) > 1 else 0
+        if self._is_duplicate_upload(top_score, scored):
+            return top_candidates[0], True
         if (
             top_score < self.LLM_SCORE_THRESHOLD
             or (top_score - second_score) < self.LLM_SCORE_DIFFERENCE
         ):
             self._log_debug("Triggering LLM fallback...")
-            return self._resolve_with_llm(spotify_track, top_candidates)
-
-        return top_candidates[0]
-
-    def _score_match(self, sp_title, sp_artist, sp_duration, yt: Dict) -> tuple:
-        yt_title = self._normalize_text(yt.get("title", ""))
-        yt_artist = (
-            self._normalize_text(yt["artists"][0]["name"]) if yt.get("artists") else ""
+            resolved = self._resolve_with_llm(spotify_track, top_candidates)
+            if resolved is None:
+                return top_candidates[0], False
+            return resolved, True
+
+        return top_candidates[0], True
+
+    def _is_duplicate_upload(self, top_score: float, scored: List[tuple]) -> bool:
+        """A strong top match whose runner-up is the same title needs no LLM tie-break."""
+        if len(scored) < 2:
+            return False
+        if top_score < self.LLM_SCORE_THRESHOLD + self.DUPLICATE_SCORE_MARGIN:
+            return False
+        top, runner_up = scored[0][1], scored[1][1]
+        if top.get("videoId") and top.get("videoId") == runner_up.get("videoId"):
+            return True
+        return (
+            self._normalize_candidate(top)["title"]
+            == self._normalize_candidate(runner_up)["title"]
         )
-        yt_duration = yt.get("duration_seconds", 0)
 
-        title_score = fuzz.token_sort_ratio(sp_title, yt_title)
-        artist_score = jaro_winkler(sp_artist, yt_artist) * 100
-        duration_score = max(0, 100 - abs(sp_duration - yt_duration))
+    def _score_candidates(
+        self, sp_title: str, sp_artist: str, sp_duration: int, youtube_results: List[Dict]
+    ) -> List[tuple]:
+        """Score every YouTube candidate against the Spotify track in one pass."""
+        normalized = [self._normalize_candidate(yt) for yt in youtube_results]
+        yt_titles = [n["title"] for n in normalized]
+        yt_artists = [n["artist"] for n in normalized]
+        yt_durations = np.fromiter(
+            (n["duration"] for n in normalized),
+            dtype=np.int64,
+            count=len(normalized),
+        )
 
-        total_score = (
-            title_score * self.TITLE_WEIGHT
-            + artist_score * self.ARTIST_WEIGHT
-            + duration_score * self.DURATION_WEIGHT
+        # One C++ call per field scores the whole candidate row at once.
+        title_scores = process.cdist(
+            [sp_title], yt_titles, scorer=fuzz.token_sort_ratio, dtype=np.float64
+        )[0]
+        # Jaro-Winkler is on a 0-1 scale; its x100 is folded into the weight.
+        artist_similarity = process.cdist(
+            [sp_artist],
+            yt_artists,
+            scorer=JaroWinkler.normalized_similarity,
+            dtype=np.float64,
+        )[0]
+        duration_scores = np.maximum(0, 100 - np.abs(yt_durations - sp_duration))
+
+        total_scores = (
+            title_scores * self.TITLE_WEIGHT
+            + artist_similarity * (self.ARTIST_WEIGHT * 100)
+            + duration_scores * self.DURATION_WEIGHT
         )
 
         if self.debug:
-            self._log_debug(
-                f"{yt.get('title', '')} | Artist: {yt_artist} | Duration: {yt_duration}s\n"
-                f"→ Title: {title_score:.1f}, Artist: {artist_score:.1f}, Duration: {duration_score:.1f}, Total: {total_score:.1f}\n"
-                + "-" * 40
-            )
+            artist_scores = artist_similarity * 100
+            for i, yt in enumerate(youtube_results):
+                self._log_debug(
+                    f"{yt.get('title', '')} | Artist: {yt_artists[i]} | Duration: {yt_durations[i]}s\n"
+                    f"→ Title: {title_scores[i]:.1f}, Artist: {artist_scores[i]:.1f}, Duration: {duration_scores[i]:.1f}, Total: {total_scores[i]:.1f}\n"
+                    + "-" * 40
+                )
 
-        return total_score, yt
+        return list(zip(total_scores.tolist(), youtube_results))
 
     # === LLM Matching ===
 
-    def _resolve_with_llm(self, spotify_track: Dict, candidates: List[Dict]) -> Dict:
+    def _resolve_with_llm(
+        self, spotify_track: Dict, candidates: List[Dict]
+    ) -> Optional[Dict]:
         def format_candidate(i: int, c: Dict) -> str:
-            return f"{i}. {self._safe_get(c, ['title'], 'Unknown')} by {self._safe_get(c, ['artists', 0, 'name'], 'Unknown')} ({self._safe_get(c, ['duration'], '?')}) | Album: {self._safe_get(c, ['album', 'name'], 'unknown')}"
+            return f"{i}|{self._safe_get(c, ['title'], 'Unknown')}|{self._safe_get(c, ['artists', 0, 'name'], 'Unknown')}|{self._safe_get(c, ['duration'], '?')}|{self._safe_get(c, ['album', 'name'], 'unknown')}"
 
-        prompt = f"""
-        Analyze this music track matching request. Return JSON with 'index' (0-2) and 'confidence' (0-100).
-
-        Spotify Track:
-        - Title: {spotify_track['name']}
-        - Artist: {spotify_track['artists'][0]['name']}
-        - Album: {spotify_track['album']['name']}
-        - Duration: {spotify_track['duration_ms']//1000}s
-
-        YouTube Candidates:
-        {json.dumps([format_candidate(i, c) for i, c in enumerate(candidates)], indent=2)}
-        """
+        candidate_block = "\n".join(
+            format_candidate(i, c) for i, c in enumerate(candidates)
+        )
+        prompt = self.JUDGE_PROMPT_TEMPLATE.format(
+            max_index=len(candidates) - 1,
+            track=spotify_track["name"],
+            artist=spotify_track["artists"][0]["name"],
+            duration=spotify_track["duration_ms"] // 1000,
+            album=spotify_track["album"]["name"],
+            candidates=candidate_block,
+        )
 
-        self._log_debug(f"LLM PROMPT:\n{prompt}", divider=True)
+        if self.debug:
+            self._log_debug(f"LLM PROMPT:\n{prompt}", divider=True)
 
+        cache_key = self._llm_cache_key(prompt)
         try:
-            response = ollama.generate(
-                model="",
-                prompt=prompt,
-                format="json",
-                options={"temperature": 0.3, "num_ctx": 4096},
-            )
-            result = json.loads(response["response"])
-            self._log_debug(f"LLM RESPONSE:\n{response}", divider=True)
+            raw = self._get_cached_llm_response(cache_key)
+            if raw is None:
+                with self._llm_slots:
+                    response = self.llm.generate(
+                        model=self.OLLAMA_MODEL,
+                        prompt=prompt,
+                        keep_alive=self.OLLAMA_KEEP_ALIVE,
+                        format=self.JUDGE_SCHEMA,
+                        options={"temperature": 0.3, "num_ctx": 4096},
+                    )
+                raw = response["response"]
+                if self.debug:
+                    self._log_debug(f"LLM RESPONSE:\n{response}", divider=True)
+            result = json.loads(raw)
+            if not 0 <= result["index"] < len(candidates):
+                raise ValueError(f"index {result['index']} out of range")
+            self._set_cached_llm_response(cache_key, raw)
             return candidates[result["index"]]
         except Exception as e:
             self._log_debug(f"LLM failed: {e}, using top candidate")
-            return candidates[0]
+            return None
+
+    def _llm_cache_key(self, prompt: str) -> str:
+        digest = hashlib.blake2b(
+            f"{self.OLLAMA_MODEL}\0{prompt}".encode(), digest_size=16
+        ).hexdigest()
+        return f"llm:{digest}"
+
+    def _get_cached_llm_response(self, cache_key: str) -> Optional[str]:
+        if not self.LLM_CACHE_ENABLED:
+            return None
+        return self.cache.get(cache_key, self.CACHE_TTL)
+
+    def _set_cached_llm_response(self, cache_key: str, response: str) -> None:
+        if self.LLM_CACHE_ENABLED:
+            self.cache.set(cache_key, response)
 
     # === Search Query Generation ===
 
     def generate_search_query(self, spotify_track: Dict) -> str:
         """Use LLM or fallback to generate a YTMusic search query."""
-        metadata = {
-            "track": spotify_track.get("name", ""),
-            "artists": [a["name"] for a in spotify_track.get("artists", [])],
-            "album": spotify_track.get("album", {}).get("name", ""),
-            "duration": f"{spotify_track.get('duration_ms', 0) // 1000}s",
-            "isrc": spotify_track.get("external_ids", {}).get("isrc", "N/A"),
-        }
+        if not self._needs_llm_query(spotify_track):
+            query = self._fallback_search_query(spotify_track)
+            if self.debug:
+                self._log_debug(f"Clean track, skipping LLM query: {query}")
+            return query
 
-        prompt = f"""Generate the most effective YouTube Music search query for:
-        Track: {metadata['track']}
-        Artists: {', '.join(metadata['artists'])}
-        Album: {metadata['album']}
-        Duration: {metadata['duration']}
-        ISRC: {metadata['isrc']}
-        Respond ONLY with the query."""
+        prompt = self._build_query_prompt(spotify_track)
+        cache_key = self._llm_cache_key(prompt)
+        cached_query = self._get_cached_llm_response(cache_key)
+        if cached_query is not None:
+            return cached_query
 
         try:
-            response = ollama.generate(
-                model=self.OLLAMA_MODEL, prompt=prompt, options={"temperature": 0.2}
-            )
-            query = response["response"].strip().strip('"')
-            self._log_debug(f"Generated LLM query: {query}")
+            # Stream and stop at the first line: the query is short, anything
+            # after it is commentary we'd otherwise wait for the model to decode.
+            buffer = ""
+            with self._llm_slots:
+                for chunk in self.llm.generate(
+                    model=self.OLLAMA_MODEL,
+                    prompt=prompt,
+                    keep_alive=self.OLLAMA_KEEP_ALIVE,
+                    options={"temperature": 0.2},
+                    stream=True,
+                ):
+                    buffer += chunk["response"]
+                    if self._query_complete(buffer):
+                        break
+            query = self._clean_query(buffer)
+            if self.debug:
+                self._log_debug(f"Generated LLM query: {query}")
+            if query:
+                self._set_cached_llm_response(cache_key, query)
             return query
         except Exception as e:
             self._log_debug(f"LLM query failed: {e}, using fallback")
             return self._fallback_search_query(spotify_track)
 
+    def _query_complete(self, buffer: str) -> bool:
+        return "\n" in buffer.lstrip() or len(buffer) > self.MAX_QUERY_CHARS
+
+    @staticmethod
+    def _clean_query(buffer: str) -> str:
+        lines = buffer.strip().splitlines()
+        return lines[0].strip().strip('"') if lines else ""
+
+    @classmethod
+    def _build_query_prompt(cls, spotify_track: Dict) -> str:
+        return cls.QUERY_PROMPT_TEMPLATE.format(
+            track=spotify_track.get("name", ""),
+            artists=", ".join(a["name"] for a in spotify_track.get("artists", [])),
+            album=spotify_track.get("album", {}).get("name", ""),
+            duration=spotify_track.get("duration_ms", 0) // 1000,
+            isrc=spotify_track.get("external_ids", {}).get("isrc", "N/A"),
+        )
+
+    @classmethod
+    def _needs_llm_query(cls, track: Dict) -> bool:
+        """Whether the heuristic query could miss; clean single-artist tracks can't."""
+        if len(track.get("artists", [])) != 1:
+            return True
+        title = track.get("name", "").lower()
+        album = track.get("album", {}).get("name", "").lower()
+        if "(" in title or "[" in title:
+            return True
+        return any(k in title or k in album for k in cls.QUERY_NOISE_KEYWORDS)
+
     def _fallback_search_query(self, track: Dict) -> str:
         """Basic heuristic fallback for search query generation."""
         artists = [a["name"] for a in track.get("artists", [])]
         album = track.get("album", {}).get("name", "")
-        keywords = {"remaster", "deluxe", "live", "version", "edit", "mix", "bonus"}
-
         parts = [track.get("name", ""), artists[0] if artists else ""]
         if len(artists) > 1:
             parts.append("feat. " + ", ".join(artists[1:]))
-        if any(k in album.lower() for k in keywords):
+        if any(k in album.lower() for k in self.QUERY_NOISE_KEYWORDS):
             parts.append(album)
 
-        return re.sub(r"\s+", " ", " ".join(parts)).strip()
+        return _WHITESPACE_RE.sub(" ", " ".join(parts)).strip()
 
     # === Playlist Utilities ===
 
@@ -202,13 +558,22 @@ class MusicMatcher:
         self, playlist_id: str, market: Optional[str] = None
     ) -> List[str]:
         """Retrieve track IDs from a Spotify playlist."""
-        tracks = []
-        offset, limit = 0, 100
+        # snapshot_id changes whenever the playlist is edited, so an unchanged
+        # playlist is served from the cache without paging through it.
+        snapshot_id = self.spotify.playlist(playlist_id, fields="snapshot_id")[
+            "snapshot_id"
+        ]
+        cache_key = f"playlist:{playlist_id}:{snapshot_id}:{market}"
+        cached_ids = self.cache.get(cache_key, self.CACHE_TTL)
+        if cached_ids is not None:
+            return cached_ids
+
+        limit = 100
 
-        while True:
+        def fetch_page(offset: int) -> Dict:
             result = self.spotify.playlist_items(
                 playlist_id,
-                fields="items(track(id))",
+                fields="total,items(track(id))",
                 limit=limit,
                 offset=offset,
                 market=market,
@@ -216,13 +581,40 @@ class MusicMatcher:
             )
             if not result:
                 raise Exception("Results of playlist items are empty")
-            items = result.get("items", [])
-            tracks += [i["track"]["id"] for i in items if i.get("track", {}).get("id")]
-            if len(items) < limit:
-                break
-            offset += limit
+            return result
+
+        # The first page tells us the total, so the rest can be fetched at once.
+        first_page = fetch_page(0)
+        pages = [first_page]
+        offsets = range(limit, first_page.get("total", 0), limit)
+        if offsets:
+            with ThreadPoolExecutor(max_workers=self.PLAYLIST_PAGE_WORKERS) as executor:
+                pages.extend(executor.map(fetch_page, offsets))
+
+        track_ids = [
+            i["track"]["id"]
+            for page in pages
+            for i in page.get("items", [])
+            if i.get("track", {}).get("id")
+        ]
+        self.cache.set(cache_key, track_ids)
+        return track_ids
+
+    def get_tracks(
+        self, track_ids: List[str], market: Optional[str] = None
+    ) -> List[Dict]:
+        """Fetch full Spotify track objects, 50 IDs per request."""
+        batch_size = 50
+        batches = [
+            track_ids[i : i + batch_size] for i in range(0, len(track_ids), batch_size)
+        ]
 
-        return tracks
+        def fetch_batch(ids: List[str]) -> List[Dict]:
+            result = self.spotify.tracks(ids, market=market)
+            return [t for t in result.get("tracks", []) if t]
+
+        with ThreadPoolExecutor(max_workers=self.PLAYLIST_PAGE_WORKERS) as executor:
+            return [t for batch in executor.map(fetch_batch, batches) for t in batch]
 
     def get_rekordbox_playlists(self, user_id: str) -> Dict[str, str]:
         """Find playlists that look like rekordbox exports."""
@@ -235,9 +627,23 @@ class MusicMatcher:
 
     # === Helpers ===
 
+    @classmethod
+    def _normalize_candidate(cls, yt: Dict) -> Dict:
+        """Normalized title/artist/duration, leaving the ytmusicapi result untouched."""
+        return {
+            "title": cls._normalize_text(yt.get("title", "")),
+            "artist": (
+                cls._normalize_text(yt["artists"][0]["name"])
+                if yt.get("artists")
+                else ""
+            ),
+            "duration": yt.get("duration_seconds", 0),
+        }
+
     @staticmethod
+    @lru_cache(maxsize=8192)
     def _normalize_text(text: str) -> str:
-        return re.sub(r"[^a-z0-9]", "", text.lower())
+        return _NON_ALNUM_RE.sub("", text.lower())
 
     @staticmethod
     def _safe_get(d: dict, keys: List, default=None):
@@ -9,15 +9,26 @@
 
 # %%
 import os
+import re
+import csv
 import json
 import time
+import atexit
+import random
+import shelve
+import hashlib
 import logging
+import threading
 import requests
+from requests.adapters import HTTPAdapter, Retry
 from pathlib import Path
 from typing import Dict, List, Set, Optional, Tuple
-from dataclasses import dataclass
+from dataclasses import dataclass, asdict, field, fields
+from functools import lru_cache
+from collections import Counter
 from concurrent.futures import ThreadPoolExecutor, as_completed
-import pandas as pd
+from rapidfuzz import fuzz, process
+from rapidfuzz.distance import JaroWinkler
 
 # Music APIs
 import spotipy
@@ -56,12 +67,41 @@ YTMUSIC_AUTH_FILE = ""  # Path to headers_auth.json or leave empty
 # Ollama configuration
 OLLAMA_BASE_URL = "http://localhost:11434"
 OLLAMA_MODEL = "gemma:latest"
+OLLAMA_SCORING_MODEL = OLLAMA_MODEL  # e.g. "gemma:2b" for faster similarity scoring
+# Scoring is a structured task, so decode greedily instead of sampling
+SCORING_OPTIONS = {"temperature": 0, "top_k": 1}
+OLLAMA_PARALLEL = 2  # Similarity requests in flight; match OLLAMA_NUM_PARALLEL on the server
+SIMILARITY_CACHE_PATH = ".similarity_cache"  # On-disk cache of AI similarity scores
+OLLAMA_TIMEOUT = 30  # Seconds to wait for a single-track generate call
+OLLAMA_TIMEOUT_PER_CANDIDATE = 5  # Extra seconds per candidate in a batched scoring call
 
 # Download settings
 DOWNLOAD_DIR = Path("./music_downloads")
-MAX_WORKERS = 2  # Number of concurrent downloads
+DOWNLOAD_ARCHIVE = DOWNLOAD_DIR / ".download_archive"  # yt-dlp's record of videos already downloaded
+MAX_DOWNLOAD_WORKERS = 6  # Number of concurrent downloads
+TAG_WORKERS = 8  # Concurrent ID3 tag writes after downloading
+FORCE_MP3 = True  # Re-encode to MP3 320; False keeps YouTube's m4a/opus audio and skips ffmpeg
+AUDIO_EXTENSIONS = ('.mp3', '.m4a', '.opus', '.webm')
+# With FORCE_MP3 the other formats are yt-dlp intermediates, so only an MP3 means a finished download
+FINISHED_EXTENSIONS = ('.mp3',) if FORCE_MP3 else AUDIO_EXTENSIONS
+SPOTIFY_PAGE_WORKERS = 10  # Concurrent Spotify page requests
+HTTP_POOL_SIZE = 20  # Keep-alive connections per host on the shared HTTP session
 SIMILARITY_THRESHOLD = 0.7  # AI similarity threshold (0.0-1.0)
 MAX_YT_CANDIDATES = 5  # Number of YouTube candidates to analyze per song
+SEARCH_WORKERS = 8  # Concurrent YouTube Music track searches
+YTMUSIC_MIN_INTERVAL = 0.1  # Minimum seconds between YouTube Music requests (all workers)
+SEARCH_CACHE_PATH = ".ytmusic_search_cache"  # On-disk cache of per-track search candidates
+SEARCH_CACHE_TTL = 24 * 3600  # Seconds a track's candidates stay fresh
+SEARCH_NEGATIVE_TTL = 5 * 60  # Seconds an empty/failed search is remembered
+SIMILARITY_BATCH_SIZE = 8  # Tracks scored per Ollama call
+DURATION_TOLERANCE_SECONDS = 30  # Candidates further off than this skip AI scoring
+EXACT_DURATION_SECONDS = 3  # Official uploads this close are accepted without AI
+LLM_CONFIDENCE_GAP = 50  # Quality-score lead over the runner-up that skips AI scoring
+LLM_MIN_QUALITY = 150  # ...as long as the leader scores at least this much
+FUZZY_ACCEPT_SCORE = 92  # WRatio at or above this is a match without AI scoring
+FUZZY_REJECT_SCORE = 70  # WRatio below this is no match without AI scoring
+BLOCKING_PREFIX_LENGTH = 3  # Leading artist characters a candidate must share...
+BLOCKING_MIN_SIMILARITY = 0.7  # ...unless its "artist title" is at least this Jaro-Winkler similar
 RETRY_ATTEMPTS = 3
 
 # Quality preferences (higher number = higher preference)
@@ -76,6 +116,45 @@ QUALITY_WEIGHTS = {
     'audio_quality': 40         # Audio quality indicators
 }
 
+# yt-dlp settings for high quality audio; 'outtmpl' is added per track
+YDL_OPTS = {
+    'format': 'bestaudio[ext=m4a]/bestaudio[ext=mp3]/bestaudio/best',
+    'extractaudio': True,
+    'audioformat': 'mp3',
+    'audioquality': '0',  # Best quality
+    'embed_thumbnail': True,
+    'add_metadata': True,
+    'writesubtitles': False,
+    'writeautomaticsub': False,
+    'ignoreerrors': False,
+    'no_warnings': False,
+    'quiet': True,
+    'retries': 3,
+    'fragment_retries': 3,
+    'skip_unavailable_fragments': True,
+    'extract_flat': False,
+    'writethumbnail': False,
+    'postprocessors': [{
+        'key': 'FFmpegExtractAudio',
+        'preferredcodec': 'mp3',
+        'preferredquality': '320',
+    }] if FORCE_MP3 else []
+}
+
+# Keyword scans run once per candidate, so each list is a single compiled pattern
+OFFICIAL_INDICATORS_RE = re.compile('|'.join(map(re.escape, [
+    'official',
+    'vevo',
+    'records',
+    'music',
+    '- topic',
+    'official video',
+    'official audio'
+])))
+LABEL_CHANNEL_RE = re.compile('vevo|records')
+AUDIO_QUALITY_RE = re.compile('|'.join(map(re.escape, ['hd', 'hq', 'high quality', '320', 'flac', 'lossless'])))
+NON_ALNUM_RE = re.compile(r'[\W_]+')  # Strips a name down to letters and digits in any script
+
 # Create download directory
 DOWNLOAD_DIR.mkdir(exist_ok=True)
 
@@ -85,7 +164,7 @@ print("Configuration loaded successfully!")
 # ## 3. Data Classes and Utility Functions
 
 # %%
-@dataclass
+@dataclass(slots=True)
 class Track:
     name: str
     artist: str
@@ -96,6 +175,16 @@ class Track:
     source: str = ""
     popularity: int = 0
     release_date: str = ""
+    # Lowercased once for matching instead of on every comparison
+    name_lower: str = field(init=False, repr=False, compare=False)
+    artist_lower: str = field(init=False, repr=False, compare=False)
+    # Casefolded (name, artist) identity used for deduplication
+    signature: Tuple[str, str] = field(init=False, repr=False, compare=False)
+    
+    def __post_init__(self):
+        self.name_lower = self.name.lower()
+        self.artist_lower = self.artist.lower()
+        self.signature = (self.name.casefold().strip(), self.artist.casefold().strip())
     
     def __str__(self):
         return f"{self.artist} - {self.name}"
@@ -113,7 +202,7 @@ class Track:
             'release_date': self.release_date
         }
 
-@dataclass
+@dataclass(slots=True)
 class YouTubeCandidate:
     video_id: str
     title: str
@@ -125,14 +214,68 @@ class YouTubeCandidate:
     is_music: bool
     quality_score: float
     upload_date: str = ""
+    # Lowercased once for matching instead of on every comparison
+    title_lower: str = field(init=False, repr=False, compare=False)
+    artist_lower: str = field(init=False, repr=False, compare=False)
+    channel_lower: str = field(init=False, repr=False, compare=False)
+    
+    def __post_init__(self):
+        self.title_lower = self.title.lower()
+        self.artist_lower = self.artist.lower()
+        self.channel_lower = self.channel_name.lower()
     
     def __str__(self):
         return f"{self.title} by {self.artist} ({self.channel_name})"
 
+@lru_cache(maxsize=4096)
 def safe_filename(text: str) -> str:
     """Create a safe filename from text"""
     return "".join(c for c in text if c.isalnum() or c in (' ', '-', '_', '.')).strip()
 
+def create_pooled_session(pool_size: int = 20, retry: bool = True) -> requests.Session:
+    """Create a requests session that keeps up to pool_size connections alive per host"""
+    session = requests.Session()
+    # spotipy drops its own retry policy once given a session, and ytmusicapi has none
+    max_retries = Retry(
+        total=RETRY_ATTEMPTS,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=None,
+        respect_retry_after_header=True
+    ) if retry else 0
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=max_retries)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+# One keep-alive pool shared by the Spotify and YouTube Music clients
+HTTP_SESSION = create_pooled_session(HTTP_POOL_SIZE)
+# Ollama gets its own pool without retries: a timed-out generate would otherwise be
+# re-run from scratch, and a stopped server would stall is_available()
+OLLAMA_SESSION = create_pooled_session(OLLAMA_PARALLEL, retry=False)
+
+class RateLimiter:
+    """Space calls at least min_interval seconds apart across all threads"""
+    
+    def __init__(self, min_interval: float):
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._next_time = 0.0
+    
+    def wait(self):
+        """Block until this caller's slot comes up"""
+        with self._lock:
+            now = time.monotonic()
+            wait_time = self._next_time - now
+            self._next_time = max(now, self._next_time) + self.min_interval
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+def _artist_blocking_key(artist: str) -> str:
+    """Leading alphanumeric characters of an artist name, for cheap candidate blocking"""
+    return NON_ALNUM_RE.sub('', artist)[:BLOCKING_PREFIX_LENGTH]
+
+@lru_cache(maxsize=4096)
 def format_duration(ms: int) -> str:
     """Convert milliseconds to MM:SS format"""
     seconds = ms // 1000
@@ -147,10 +290,20 @@ print("Data classes and utilities defined!")
 
 # %%
 class OllamaClient:
-    def __init__(self, base_url: str = OLLAMA_BASE_URL, model: str = OLLAMA_MODEL):
+    def __init__(self, base_url: str = OLLAMA_BASE_URL, model: str = OLLAMA_MODEL, scoring_model: str = OLLAMA_SCORING_MODEL):
         self.base_url = base_url
         self.model = model
-        self.session = requests.Session()
+        self.scoring_model = scoring_model
+        self.session = OLLAMA_SESSION
+        # Scores keyed by (track, video, model) survive between runs
+        self._score_cache = shelve.open(SIMILARITY_CACHE_PATH)
+        self._score_cache_lock = threading.Lock()
+        atexit.register(self.close)
+    
+    def close(self):
+        """Flush and release the score cache so the file can be reopened"""
+        with self._score_cache_lock:
+            self._score_cache.close()
     
     def is_available(self) -> bool:
         """Check if Ollama is available"""
@@ -160,11 +313,11 @@ class OllamaClient:
         except:
             return False
     
-    def generate(self, prompt: str, temperature: float = 0.1) -> str:
+    def generate(self, prompt: str, temperature: float = 0.1, format: Optional[str] = None, model: Optional[str] = None, options: Optional[dict] = None, timeout: float = OLLAMA_TIMEOUT) -> str:
         """Generate response using Ollama"""
         try:
             payload = {
-                "model": self.model,
+                "model": model or self.model,
                 "prompt": prompt,
                 "stream": False,
                 "options": {
@@ -173,11 +326,15 @@ class OllamaClient:
                     "top_k": 40
                 }
             }
+            if format:
+                payload["format"] = format
+            if options:
+                payload["options"].update(options)
             
             response = self.session.post(
                 f"{self.base_url}/api/generate",
                 json=payload,
-                timeout=30
+                timeout=timeout
             )
             
             if response.status_code == 200:
@@ -191,6 +348,27 @@ class OllamaClient:
     
     def analyze_song_similarity(self, spotify_track: Track, youtube_candidates: List[YouTubeCandidate]) -> List[Tuple[YouTubeCandidate, float]]:
         """Use AI to analyze similarity between Spotify track and YouTube candidates"""
+        similarity_scores, uncached = self._split_cached_scores(spotify_track, youtube_candidates)
+        
+        if uncached:
+            ai_scores = self._query_song_similarity(spotify_track, uncached)
+            self._store_scores(spotify_track, ai_scores)
+            similarity_scores.extend(ai_scores)
+            
+            # Candidates the model skipped fall back to basic matching rather than dropping out
+            missing = self._missing_candidates(uncached, ai_scores)
+            if missing:
+                logger.warning(f"AI scores missing for {len(missing)} candidates, using fallback similarity")
+                for candidate in missing:
+                    score = self._fallback_similarity(spotify_track, candidate)
+                    similarity_scores.append((candidate, score))
+        
+        # Sort by similarity score (descending)
+        similarity_scores.sort(key=lambda x: x[1], reverse=True)
+        return similarity_scores
+    
+    def _query_song_similarity(self, spotify_track: Track, youtube_candidates: List[YouTubeCandidate]) -> List[Tuple[YouTubeCandidate, float]]:
+        """Ask the model to score candidates; returns only the scores it parsed"""
         
         prompt = f"""You are a music expert analyzing song matches. Compare this Spotify track with YouTube candidates and rate similarity.
 
@@ -222,16 +400,25 @@ For each candidate, provide a similarity score from 0.0 to 1.0 based on:
 - Channel credibility (official artists, verified channels)
 - Audio quality indicators
 
-Respond in this exact format for each candidate:
-Candidate 1: 0.X - [brief reason]
-Candidate 2: 0.X - [brief reason]
-...
+Respond with JSON only, one entry per candidate:
+{"scores": [{"candidate": 1, "score": 0.95}, {"candidate": 2, "score": 0.4}]}
 
 Be strict with scoring. Only give 0.9+ for near-perfect matches."""
         
-        response = self.generate(prompt)
+        response = self.generate(prompt, format="json", model=self.scoring_model, options={
+            **SCORING_OPTIONS,
+            "num_ctx": 2048,
+            "num_predict": 256
+        })
+        
+        try:
+            parsed = json.loads(response)
+            if isinstance(parsed, dict):
+                return self._parse_batch_scores(parsed.get("scores"), youtube_candidates)
+        except json.JSONDecodeError:
+            pass
         
-        # Parse the response
+        # Not JSON after all: parse "Candidate N: score" lines
         similarity_scores = []
         lines = [line.strip() for line in response.split('\n') if line.strip()]
         
@@ -250,14 +437,121 @@ Be strict with scoring. Only give 0.9+ for near-perfect matches."""
                     logger.warning(f"Failed to parse similarity line: {line} - {e}")
                     continue
         
-        # If parsing failed, fall back to basic matching
-        if not similarity_scores:
-            logger.warning("AI parsing failed, using fallback similarity")
+        return similarity_scores
+    
+    def _missing_candidates(self, candidates: List[YouTubeCandidate], similarity_scores: List[Tuple[YouTubeCandidate, float]]) -> List[YouTubeCandidate]:
+        """Candidates that did not get a score"""
+        scored_ids = {candidate.video_id for candidate, _ in similarity_scores}
+        return [candidate for candidate in candidates if candidate.video_id not in scored_ids]
+    
+    def _score_key(self, spotify_track: Track, candidate: YouTubeCandidate) -> str:
+        """Cache key for a (track, video, model) score"""
+        track_key = spotify_track.spotify_id or f"{spotify_track.name_lower}|{spotify_track.artist_lower}"
+        return hashlib.blake2b(f"{track_key}|{candidate.video_id}|{self.scoring_model}".encode(), digest_size=16).hexdigest()
+    
+    def _split_cached_scores(self, spotify_track: Track, youtube_candidates: List[YouTubeCandidate]) -> Tuple[List[Tuple[YouTubeCandidate, float]], List[YouTubeCandidate]]:
+        """Split candidates into already-scored (with their scores) and still-unscored"""
+        cached, uncached = [], []
+        with self._score_cache_lock:
             for candidate in youtube_candidates:
-                score = self._fallback_similarity(spotify_track, candidate)
-                similarity_scores.append((candidate, score))
+                score = self._score_cache.get(self._score_key(spotify_track, candidate))
+                if score is None:
+                    uncached.append(candidate)
+                else:
+                    cached.append((candidate, score))
+        return cached, uncached
+    
+    def _store_scores(self, spotify_track: Track, similarity_scores: List[Tuple[YouTubeCandidate, float]]):
+        """Persist AI scores so later runs skip the model for these pairs"""
+        with self._score_cache_lock:
+            for candidate, score in similarity_scores:
+                self._score_cache[self._score_key(spotify_track, candidate)] = score
+            self._score_cache.sync()
+    
+    def analyze_song_similarity_batch(self, pairs: List[Tuple[Track, List[YouTubeCandidate]]]) -> List[List[Tuple[YouTubeCandidate, float]]]:
+        """Score the candidates of several tracks in one Ollama call, returned in input order"""
+        
+        # Only candidates without a cached score go to the model
+        split = [self._split_cached_scores(track, candidates) for track, candidates in pairs]
+        to_query = [(track, uncached) for (track, _), (_, uncached) in zip(pairs, split) if uncached]
+        
+        parsed = {}
+        if to_query:
+            prompt = (
+                "You are a music expert analyzing song matches. For each Spotify track below, "
+                "rate how well each of its YouTube candidates matches it.\n"
+            )
+            
+            try:
+                for t, (track, candidates) in enumerate(to_query, 1):
+                    prompt += (
+                        f'\nTrack {t}: "{track.name}" by "{track.artist}" '
+                        f'(Album: "{track.album}", Duration: {format_duration(track.duration_ms)})\n'
+                    )
+                    for i, candidate in enumerate(candidates, 1):
+                        duration_str = f"{candidate.duration_seconds // 60}:{candidate.duration_seconds % 60:02d}"
+                        prompt += (
+                            f'  Candidate {i}: "{candidate.title}" | Artist: "{candidate.artist}" | '
+                            f'Channel: "{candidate.channel_name}" | Duration: {duration_str} | '
+                            f'Views: {candidate.view_count:,} | Official: {candidate.is_official}\n'
+                        )
+                
+                prompt += (
+                    "\nScore every candidate from 0.0 to 1.0 on title match, artist match, duration "
+                    "similarity and channel credibility. Be strict: only give 0.9+ for near-perfect matches.\n"
+                    "Respond with JSON mapping each track number to its candidate scores, e.g. "
+                    '{"1": [{"candidate": 1, "score": 0.95}, {"candidate": 2, "score": 0.4}], "2": [...]}'
+                )
+                
+                # Roughly 3 characters per token for the prompt, ~20 tokens per score in the answer
+                num_candidates = sum(len(candidates) for _, candidates in to_query)
+                response = self.generate(prompt, format="json", model=self.scoring_model, options={
+                    **SCORING_OPTIONS,
+                    "num_ctx": min(8192, max(2048, len(prompt) // 3 + 512)),
+                    "num_predict": 32 + 20 * num_candidates
+                }, timeout=OLLAMA_TIMEOUT + OLLAMA_TIMEOUT_PER_CANDIDATE * num_candidates)
+                parsed = json.loads(response) if response else {}
+            except (ValueError, TypeError) as e:
+                logger.warning(f"Batch similarity failed: {e}")
+            
+            if not isinstance(parsed, dict):
+                parsed = {}
+        
+        results = []
+        t = 0
+        for (track, candidates), (similarity_scores, uncached) in zip(pairs, split):
+            if uncached:
+                t += 1
+                ai_scores = self._parse_batch_scores(parsed.get(str(t)), uncached)
+                self._store_scores(track, ai_scores)
+                similarity_scores.extend(ai_scores)
+                
+                # Any candidate the batch answer missed is analyzed on its own
+                missing = self._missing_candidates(uncached, ai_scores)
+                if missing:
+                    logger.warning(f"Batch scores missing for {len(missing)} candidates of {track}, analyzing individually")
+                    similarity_scores.extend(self.analyze_song_similarity(track, missing))
+            
+            similarity_scores.sort(key=lambda x: x[1], reverse=True)
+            results.append(similarity_scores)
+        
+        return results
+    
+    def _parse_batch_scores(self, entries, candidates: List[YouTubeCandidate]) -> List[Tuple[YouTubeCandidate, float]]:
+        """Parse one track's [{"candidate": n, "score": x}, ...] list from a batch response"""
+        similarity_scores = []
+        
+        for entry in entries or []:
+            try:
+                candidate_num = int(entry['candidate']) - 1
+                score = float(entry['score'])
+                
+                if 0 <= candidate_num < len(candidates):
+                    similarity_scores.append((candidates[candidate_num], score))
+            except (KeyError, ValueError, TypeError) as e:
+                logger.warning(f"Failed to parse batch similarity entry: {entry} - {e}")
+                continue
         
-        # Sort by similarity score (descending)
         similarity_scores.sort(key=lambda x: x[1], reverse=True)
         return similarity_scores
     
@@ -266,8 +560,8 @@ Be strict with scoring. Only give 0.9+ for near-perfect matches."""
         score = 0.0
         
         # Title similarity (basic)
-        spotify_title = spotify_track.name.lower()
-        youtube_title = youtube_candidate.title.lower()
+        spotify_title = spotify_track.name_lower
+        youtube_title = youtube_candidate.title_lower
         
         if spotify_title in youtube_title or youtube_title in spotify_title:
             score += 0.4
@@ -275,8 +569,8 @@ Be strict with scoring. Only give 0.9+ for near-perfect matches."""
             score += 0.2
         
         # Artist similarity
-        spotify_artist = spotify_track.artist.lower()
-        youtube_artist = youtube_candidate.artist.lower()
+        spotify_artist = spotify_track.artist_lower
+        youtube_artist = youtube_candidate.artist_lower
         
         if spotify_artist in youtube_artist or youtube_artist in spotify_artist:
             score += 0.3
@@ -296,7 +590,11 @@ Be strict with scoring. Only give 0.9+ for near-perfect matches."""
         
         return min(score, 1.0)
 
-# Initialize Ollama client
+# Initialize Ollama client, releasing the previous one's cache if this cell is re-run
+try:
+    ollama.close()
+except NameError:
+    pass
 ollama = OllamaClient()
 
 if ollama.is_available():
@@ -316,12 +614,16 @@ class SpotifyManager:
     def authenticate(self):
         """Authenticate with Spotify"""
         try:
-            self.client = spotipy.Spotify(auth_manager=SpotifyOAuth(
-                client_id=SPOTIFY_CLIENT_ID,
-                client_secret=SPOTIFY_CLIENT_SECRET,
-                redirect_uri=SPOTIFY_REDIRECT_URI,
-                scope="user-library-read playlist-read-private playlist-read-collaborative"
-            ))
+            self.client = spotipy.Spotify(
+                auth_manager=SpotifyOAuth(
+                    client_id=SPOTIFY_CLIENT_ID,
+                    client_secret=SPOTIFY_CLIENT_SECRET,
+                    redirect_uri=SPOTIFY_REDIRECT_URI,
+                    scope="user-library-read playlist-read-private playlist-read-collaborative",
+                    requests_session=HTTP_SESSION
+                ),
+                requests_session=HTTP_SESSION
+            )
             
             # Test the connection
             user = self.client.current_user()
@@ -337,27 +639,14 @@ class SpotifyManager:
         
         try:
             logger.info("Fetching liked songs from Spotify...")
-            results = self.client.current_user_saved_tracks(limit=50)
+            pages = self._fetch_all_pages(
+                lambda offset: self.client.current_user_saved_tracks(limit=50, offset=offset),
+                page_size=50
+            )
             
-            while results:
-                for item in results['items']:
-                    track_data = item['track']
-                    track = Track(
-                        name=track_data['name'],
-                        artist=', '.join([artist['name'] for artist in track_data['artists']]),
-                        album=track_data['album']['name'],
-                        duration_ms=track_data['duration_ms'],
-                        spotify_id=track_data['id'],
-                        source='spotify_liked',
-                        popularity=track_data['popularity'],
-                        release_date=track_data['album']['release_date']
-                    )
-                    tracks.append(track)
-                
-                if results['next']:
-                    results = self.client.next(results)
-                else:
-                    break
+            for page in pages:
+                for item in page['items']:
+                    tracks.append(self._track_from_item(item['track'], 'spotify_liked'))
             
             logger.info(f"✅ Found {len(tracks)} liked songs on Spotify")
             
@@ -366,34 +655,40 @@ class SpotifyManager:
         
         return tracks
     
+    def sample_liked_songs(self, sample_size: int) -> List[Track]:
+        """Get a random sample of liked songs, one request per sampled track"""
+        tracks = []
+        
+        try:
+            total = self.client.current_user_saved_tracks(limit=1)['total']
+            offsets = random.sample(range(total), min(sample_size, total))
+            
+            with ThreadPoolExecutor(max_workers=SPOTIFY_PAGE_WORKERS) as executor:
+                pages = executor.map(lambda offset: self.client.current_user_saved_tracks(limit=1, offset=offset), offsets)
+                for page in pages:
+                    for item in page['items']:
+                        tracks.append(self._track_from_item(item['track'], 'spotify_liked'))
+            
+        except Exception as e:
+            logger.error(f"❌ Error sampling Spotify liked songs: {e}")
+        
+        return tracks
+    
     def get_playlist_tracks(self, playlist_id: str, playlist_name: str) -> List[Track]:
         """Get tracks from a specific playlist"""
         tracks = []
         
         try:
-            logger.info(f"Fetching playlist: {playlist_name}")
-            results = self.client.playlist_tracks(playlist_id)
+            logger.debug("Fetching playlist: %s", playlist_name)
+            pages = self._fetch_all_pages(
+                lambda offset: self.client.playlist_tracks(playlist_id, limit=100, offset=offset),
+                page_size=100
+            )
             
-            while results:
-                for item in results['items']:
+            for page in pages:
+                for item in page['items']:
                     if item['track'] and item['track']['id']:  # Skip local files
-                        track_data = item['track']
-                        track = Track(
-                            name=track_data['name'],
-                            artist=', '.join([artist['name'] for artist in track_data['artists']]),
-                            album=track_data['album']['name'],
-                            duration_ms=track_data['duration_ms'],
-                            spotify_id=track_data['id'],
-                            source=f'spotify_playlist_{playlist_name}',
-                            popularity=track_data['popularity'],
-                            release_date=track_data['album']['release_date']
-                        )
-                        tracks.append(track)
-                
-                if results['next']:
-                    results = self.client.next(results)
-                else:
-                    break
+                        tracks.append(self._track_from_item(item['track'], f'spotify_playlist_{playlist_name}'))
             
             logger.info(f"✅ Found {len(tracks)} tracks in playlist: {playlist_name}")
             
@@ -402,6 +697,38 @@ class SpotifyManager:
         
         return tracks
     
+    def _fetch_all_pages(self, fetch_page, page_size: int) -> List[dict]:
+        """Fetch the first page, then every remaining offset concurrently"""
+        first_page = fetch_page(0)
+        offsets = range(page_size, first_page['total'], page_size)
+        
+        def fetch_or_skip(offset):
+            # HTTP_SESSION has already retried 429/5xx; one bad page shouldn't lose the rest
+            try:
+                return fetch_page(offset)
+            except Exception as e:
+                logger.warning(f"⚠️ Skipping Spotify page at offset {offset}: {e}")
+                return None
+        
+        # The pool size bounds the burst of concurrent page requests
+        with ThreadPoolExecutor(max_workers=SPOTIFY_PAGE_WORKERS) as executor:
+            remaining = [page for page in executor.map(fetch_or_skip, offsets) if page is not None]
+        
+        return [first_page] + remaining
+    
+    def _track_from_item(self, track_data: dict, source: str) -> Track:
+        """Build a Track from a Spotify track object"""
+        return Track(
+            name=track_data['name'],
+            artist=', '.join([artist['name'] for artist in track_data['artists']]),
+            album=track_data['album']['name'],
+            duration_ms=track_data['duration_ms'],
+            spotify_id=track_data['id'],
+            source=source,
+            popularity=track_data['popularity'],
+            release_date=track_data['album']['release_date']
+        )
+    
     def get_all_playlists(self) -> List[Track]:
         """Get tracks from all user playlists"""
         all_tracks = []
@@ -431,15 +758,25 @@ class YouTubeMusicManager:
     def __init__(self):
         self.client = None
         self.tracks = []
+        self._rate_limiter = RateLimiter(YTMUSIC_MIN_INTERVAL)
+        # Scored candidates per track, kept between runs
+        self._disk_cache = shelve.open(SEARCH_CACHE_PATH)
+        self._disk_cache_lock = threading.Lock()
+        atexit.register(self.close)
+        # Scored candidates already served this session, in front of the disk cache
+        self._candidate_cache: Dict[str, List[YouTubeCandidate]] = {}
+        # Raw search results for this session, keyed by (normalized query, filter)
+        self._search_cache: Dict[Tuple[str, str], List[dict]] = {}
         
     def authenticate(self):
         """Initialize YouTube Music client"""
         try:
+            # One keep-alive pool for every search instead of a handshake per request
             if YTMUSIC_AUTH_FILE and Path(YTMUSIC_AUTH_FILE).exists():
-                self.client = YTMusic(YTMUSIC_AUTH_FILE)
+                self.client = YTMusic(YTMUSIC_AUTH_FILE, requests_session=HTTP_SESSION)
                 logger.info("✅ YouTube Music authenticated with headers file")
             else:
-                self.client = YTMusic()
+                self.client = YTMusic(requests_session=HTTP_SESSION)
                 logger.info("✅ YouTube Music initialized (public access only)")
             return True
         except Exception as e:
@@ -447,23 +784,54 @@ class YouTubeMusicManager:
             return False
     
     def search_candidates(self, track: Track) -> List[YouTubeCandidate]:
+        """Search for multiple candidates for a track, served from the disk cache when fresh"""
+        # Duration is part of the key because it feeds the quality scores
+        key = hashlib.sha1(f"{track.name_lower}|{track.artist_lower}|{track.duration_ms // 1000}".encode()).hexdigest()
+        if key in self._candidate_cache:
+            return self._candidate_cache[key]
+        
+        with self._disk_cache_lock:
+            entry = self._disk_cache.get(key)
+        if entry is not None:
+            stored_at, candidates = entry
+            ttl = SEARCH_CACHE_TTL if candidates else SEARCH_NEGATIVE_TTL
+            if time.time() - stored_at <= ttl:
+                if candidates:
+                    self._candidate_cache[key] = candidates
+                return candidates
+        
+        candidates = self._search_candidates_uncached(track)
+        with self._disk_cache_lock:
+            self._disk_cache[key] = (time.time(), candidates)
+            self._disk_cache.sync()
+        # Empty results are retried once their short disk TTL lapses, so don't pin them here
+        if candidates:
+            self._candidate_cache[key] = candidates
+        return candidates
+    
+    def close(self):
+        """Flush and release the search cache so the file can be reopened"""
+        with self._disk_cache_lock:
+            self._disk_cache.close()
+    
+    def _search_candidates_uncached(self, track: Track) -> List[YouTubeCandidate]:
         """Search for multiple candidates for a track with quality assessment"""
         candidates = []
         
         try:
             # Try multiple search strategies
-            search_queries = [
+            search_queries = list(dict.fromkeys([
                 f"{track.artist} {track.name}",
                 f"{track.name} {track.artist}",
                 f'"{track.name}" "{track.artist}"'
-            ]
+            ]))
             
             seen_video_ids = set()
             
             for query in search_queries:
                 try:
                     # Search in songs first (higher quality)
-                    results = self.client.search(query, filter='songs', limit=MAX_YT_CANDIDATES)
+                    results = self._search(query, 'songs')
                     
                     for result in results:
                         if result['videoId'] not in seen_video_ids:
@@ -474,7 +842,7 @@ class YouTubeMusicManager:
                     
                     # Then search in videos if we need more candidates
                     if len(candidates) < MAX_YT_CANDIDATES:
-                        results = self.client.search(query, filter='videos', limit=MAX_YT_CANDIDATES - len(candidates))
+                        results = self._search(query, 'videos')[:MAX_YT_CANDIDATES - len(candidates)]
                         
                         for result in results:
                             if result['videoId'] not in seen_video_ids:
@@ -490,6 +858,9 @@ class YouTubeMusicManager:
                 if len(candidates) >= MAX_YT_CANDIDATES:
                     break
             
+            # Prune candidates that cannot be this track before scoring them
+            candidates = self._block_candidates(track, candidates)
+            
             # Calculate quality scores for each candidate
             for candidate in candidates:
                 candidate.quality_score = self._calculate_quality_score(candidate, track)
@@ -497,13 +868,40 @@ class YouTubeMusicManager:
             # Sort by quality score
             candidates.sort(key=lambda x: x.quality_score, reverse=True)
             
-            logger.info(f"Found {len(candidates)} candidates for: {track}")
+            logger.debug("Found %d candidates for: %s", len(candidates), track)
             
         except Exception as e:
             logger.error(f"❌ Error searching for {track}: {e}")
         
         return candidates[:MAX_YT_CANDIDATES]
     
+    def _block_candidates(self, track: Track, candidates: List[YouTubeCandidate]) -> List[YouTubeCandidate]:
+        """Keep candidates sharing the artist's leading characters or close on "artist title", if any are"""
+        prefix = _artist_blocking_key(track.artist_lower)
+        if not prefix:
+            # Punctuation-only names give nothing to block on
+            return candidates
+        
+        query = f"{track.artist_lower} {track.name_lower}"
+        kept = []
+        for c in candidates:
+            candidate_prefix = _artist_blocking_key(c.artist_lower)
+            if (not candidate_prefix
+                    or candidate_prefix == prefix
+                    or JaroWinkler.normalized_similarity(query, f"{c.artist_lower} {c.title_lower}") >= BLOCKING_MIN_SIMILARITY):
+                kept.append(c)
+        return kept or candidates
+    
+    def _search(self, query: str, result_filter: str) -> List[dict]:
+        """Search YouTube Music, reusing results already fetched this session"""
+        # Case and spacing don't change YouTube's results, so they share an entry
+        key = (" ".join(query.casefold().split()), result_filter)
+        if key not in self._search_cache:
+            # Only real requests are paced; cached results come back immediately
+            self._rate_limiter.wait()
+            self._search_cache[key] = self.client.search(query, filter=result_filter, limit=MAX_YT_CANDIDATES)
+        return self._search_cache[key]
+    
     def _create_candidate_from_result(self, result: dict, result_type: str) -> Optional[YouTubeCandidate]:
         """Create a YouTubeCandidate from search result"""
         try:
@@ -536,7 +934,7 @@ class YouTubeMusicManager:
                 title=title,
                 artist=artist,
                 duration_seconds=duration_seconds,
-                view_count=result.get('views', {}).get('text', '0').replace(',', '').replace(' views', '') if result.get('views') else '0',
+                view_count=self._parse_view_count(result.get('views')),
                 channel_name=channel_name,
                 is_official=is_official,
                 is_music=is_music,
@@ -564,33 +962,36 @@ class YouTubeMusicManager:
         except:
             return 0
     
+    def _parse_view_count(self, views) -> int:
+        """Parse view counts like "1,234,567 views", "2.1M" or {'text': ...} to an int"""
+        if isinstance(views, dict):
+            views = views.get('text', '')
+        if isinstance(views, (int, float)):
+            return int(views)
+        if not views:
+            return 0
+        
+        text = str(views).lower().replace(',', '').replace('views', '').strip()
+        multipliers = {'k': 1_000, 'm': 1_000_000, 'b': 1_000_000_000}
+        try:
+            if text and text[-1] in multipliers:
+                return int(float(text[:-1]) * multipliers[text[-1]])
+            return int(float(text))
+        except ValueError:
+            return 0
+    
     def _is_official_upload(self, title: str, channel_name: str, artist: str) -> bool:
         """Determine if this is likely an official upload"""
         title_lower = title.lower()
         channel_lower = channel_name.lower()
         artist_lower = artist.lower()
         
-        # Official indicators
-        official_indicators = [
-            'official',
-            'vevo',
-            'records',
-            'music',
-            '- topic',
-            'official video',
-            'official audio'
-        ]
-        
         # Check if artist name is in channel name (strong indicator)
         if artist_lower and artist_lower in channel_lower:
             return True
         
         # Check for official indicators
-        for indicator in official_indicators:
-            if indicator in title_lower or indicator in channel_lower:
-                return True
-        
-        return False
+        return bool(OFFICIAL_INDICATORS_RE.search(title_lower) or OFFICIAL_INDICATORS_RE.search(channel_lower))
     
     def _calculate_quality_score(self, candidate: YouTubeCandidate, original_track: Track) -> float:
         """Calculate quality score for a candidate"""
@@ -598,15 +999,15 @@ class YouTubeMusicManager:
         
         # Official artist channel (highest priority)
         if candidate.is_official:
-            if any(indicator in candidate.channel_name.lower() for indicator in ['vevo', 'records']):
+            if LABEL_CHANNEL_RE.search(candidate.channel_lower):
                 score += QUALITY_WEIGHTS['official_artist']
-            elif 'official' in candidate.title.lower():
+            elif 'official' in candidate.title_lower:
                 score += QUALITY_WEIGHTS['youtube_music']
             else:
                 score += QUALITY_WEIGHTS['verified_channel']
         
         # Topic channels (auto-generated, usually high quality)
-        if '- topic' in candidate.channel_name.lower():
+        if '- topic' in candidate.channel_lower:
             score += QUALITY_WEIGHTS['topic_channel']
         
         # Duration matching
@@ -619,18 +1020,13 @@ class YouTubeMusicManager:
                 score += QUALITY_WEIGHTS['exact_duration'] * 0.5
         
         # View count (popularity indicator)
-        try:
-            view_count = int(str(candidate.view_count).replace(',', '').replace(' views', ''))
-            if view_count > 1000000:  # 1M+ views
-                score += QUALITY_WEIGHTS['high_views']
-            elif view_count > 100000:  # 100K+ views
-                score += QUALITY_WEIGHTS['high_views'] * 0.5
-        except:
-            pass
+        if candidate.view_count > 1000000:  # 1M+ views
+            score += QUALITY_WEIGHTS['high_views']
+        elif candidate.view_count > 100000:  # 100K+ views
+            score += QUALITY_WEIGHTS['high_views'] * 0.5
         
         # Audio quality indicators in title
-        audio_quality_terms = ['hd', 'hq', 'high quality', '320', 'flac', 'lossless']
-        if any(term in candidate.title.lower() for term in audio_quality_terms):
+        if AUDIO_QUALITY_RE.search(candidate.title_lower):
             score += QUALITY_WEIGHTS['audio_quality']
         
         # Music-specific content
@@ -639,7 +1035,11 @@ class YouTubeMusicManager:
         
         return score
 
-# Initialize YouTube Music
+# Initialize YouTube Music, releasing the previous manager's cache if this cell is re-run
+try:
+    ytmusic_manager.close()
+except NameError:
+    pass
 ytmusic_manager = YouTubeMusicManager()
 
 # %% [markdown]
@@ -651,76 +1051,144 @@ class DownloadManager:
         self.processed_tracks = set()
         self.failed_downloads = []
         self.successful_downloads = []
+        # Videos skipped because the download archive already had them
+        self.archived_video_ids = set()
+        # Downloads run on worker threads and report back into the collections above
+        self._lock = threading.Lock()
+        
+    def download_track(self, track: Track, youtube_candidate: YouTubeCandidate, tag: bool = True, use_archive: bool = False) -> Optional[Path]:
+        """Download a single track with retry logic, returning the file path (None on failure or archive skip)"""
         
-    def download_track(self, track: Track, youtube_candidate: YouTubeCandidate, attempt: int = 1) -> bool:
-        """Download a single track with retry logic"""
+        # Create safe filename
+        safe_name = safe_filename(f"{track.artist} - {track.name}")
+        output_path = DOWNLOAD_DIR / f"{safe_name}.%(ext)s"
+        url = f"https://www.youtube.com/watch?v={youtube_candidate.video_id}"
         
-        if attempt > RETRY_ATTEMPTS:
-            logger.error(f"❌ Failed to download after {RETRY_ATTEMPTS} attempts: {track}")
+        ydl_opts = {**YDL_OPTS, 'outtmpl': str(output_path)}
+        if use_archive:
+            ydl_opts['download_archive'] = str(DOWNLOAD_ARCHIVE)
+        
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            for attempt in range(1, RETRY_ATTEMPTS + 1):
+                try:
+                    logger.debug("⬇️ Downloading: %s (Quality: %.1f)", track, youtube_candidate.quality_score)
+                    info = ydl.extract_info(url, download=True)
+                    if info is None:
+                        # yt-dlp skipped the video because the archive already records it
+                        logger.info(f"⏭️ Already archived: {track} ({youtube_candidate.video_id})")
+                        with self._lock:
+                            self.archived_video_ids.add(youtube_candidate.video_id)
+                        return None
+                    
+                    # Without re-encoding the file keeps whatever container YouTube served
+                    final_path = output_path.with_suffix('.mp3') if FORCE_MP3 else Path(ydl.prepare_filename(info))
+                    if tag:
+                        self._add_metadata(final_path, track, youtube_candidate)
+                    
+                    logger.debug("✅ Successfully downloaded: %s", track)
+                    with self._lock:
+                        self.successful_downloads.append({
+                            'track': track.to_dict(),
+                            'candidate': asdict(youtube_candidate),
+                            'file_path': str(final_path)
+                        })
+                    return final_path
+                
+                except Exception as e:
+                    logger.warning(f"⚠️ Download attempt {attempt} failed for {track}: {e}")
+                    if attempt < RETRY_ATTEMPTS:
+                        time.sleep(2 ** attempt)  # Exponential backoff
+        
+        logger.error(f"❌ Failed to download after {RETRY_ATTEMPTS} attempts: {track}")
+        with self._lock:
             self.failed_downloads.append({
                 'track': track.to_dict(),
-                'candidate': youtube_candidate.__dict__,
+                'candidate': asdict(youtube_candidate),
                 'reason': 'Max retries exceeded'
             })
-            return False
+        return None
+    
+    def download_all(self, pairs: List[Tuple[Track, YouTubeCandidate]]):
+        """Download tracks concurrently; each task gets its own YoutubeDL instance"""
+        
+        # Drop videos yt-dlp has already recorded before spinning up a YoutubeDL for each
+        archived = self._load_archive()
+        remaining = []
+        skipped_ids = set()
+        for pair in pairs:
+            if f"youtube {pair[1].video_id}" in archived:
+                skipped_ids.add(pair[1].video_id)
+            else:
+                remaining.append(pair)
+        if skipped_ids:
+            logger.info(f"⏭️ Skipping {len(pairs) - len(remaining)} tracks already in the download archive")
+            with self._lock:
+                self.archived_video_ids.update(skipped_ids)
+        pairs = remaining
+        
+        def download_single(pair):
+            track, candidate = pair
+            try:
+                return self.download_track(track, candidate, tag=False, use_archive=True)
+            except Exception as e:
+                logger.error(f"❌ Unexpected error downloading {track}: {e}")
+                return None
         
-        try:
-            # Create safe filename
-            safe_name = safe_filename(f"{track.artist} - {track.name}")
-            output_path = DOWNLOAD_DIR / f"{safe_name}.%(ext)s"
+        # Downloads are network/ffmpeg bound, so threads overlap them well
+        downloaded = []
+        with ThreadPoolExecutor(max_workers=MAX_DOWNLOAD_WORKERS) as executor:
+            future_to_pair = {executor.submit(download_single, pair): pair for pair in pairs}
             
-            # Configure yt-dlp for high quality
-            ydl_opts = {
-                'format': 'bestaudio[ext=m4a]/bestaudio[ext=mp3]/bestaudio/best',
-                'outtmpl': str(output_path),
-                'extractaudio': True,
-                'audioformat': 'mp3',
-                'audioquality': '0',  # Best quality
-                'embed_thumbnail': True,
-                'add_metadata': True,
-                'writesubtitles': False,
-                'writeautomaticsub': False,
-                'ignoreerrors': False,
-                'no_warnings': False,
-                'quiet': True,
-                'retries': 3,
-                'fragment_retries': 3,
-                'skip_unavailable_fragments': True,
-                'extract_flat': False,
-                'writethumbnail': False,
-                'postprocessors': [{
-                    'key': 'FFmpegExtractAudio',
-                    'preferredcodec': 'mp3',
-                    'preferredquality': '320',
-                }]
+            for future in as_completed(future_to_pair):
+                track, candidate = future_to_pair[future]
+                try:
+                    final_path = future.result()
+                    if final_path:
+                        downloaded.append((track, candidate, final_path))
+                        logger.info(f"✅ Completed: {track}")
+                    elif candidate.video_id in self.archived_video_ids:
+                        # Another track in this run matched the same video; already logged
+                        continue
+                    else:
+                        logger.warning(f"⚠️ Failed: {track}")
+                except Exception as e:
+                    logger.error(f"❌ Thread error for {track}: {e}")
+        
+        self._tag_downloads(downloaded)
+    
+    def downloaded_names(self) -> Set[str]:
+        """Filenames (without extension) of finished downloads in the download directory"""
+        with os.scandir(DOWNLOAD_DIR) as entries:
+            return {
+                os.path.splitext(entry.name)[0] for entry in entries
+                if entry.is_file() and entry.name.endswith(FINISHED_EXTENSIONS)
             }
-            
-            url = f"https://www.youtube.com/watch?v={youtube_candidate.video_id}"
-            
-            logger.info(f"⬇️ Downloading: {track} (Quality: {youtube_candidate.quality_score:.1f})")
-            
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                ydl.download([url])
-            
-            # Add metadata
-            final_path = output_path.with_suffix('.mp3')
-            self._add_metadata(final_path, track, youtube_candidate)
-            
-            logger.info(f"✅ Successfully downloaded: {track}")
-            self.successful_downloads.append({
-                'track': track.to_dict(),
-                'candidate': youtube_candidate.__dict__,
-                'file_path': str(final_path)
-            })
-            return True
-            
-        except Exception as e:
-            logger.warning(f"⚠️ Download attempt {attempt} failed for {track}: {e}")
-            time.sleep(2 ** attempt)  # Exponential backoff
-            return self.download_track(track, youtube_candidate, attempt + 1)
+    
+    def _load_archive(self) -> Set[str]:
+        """Read yt-dlp's download archive ("extractor video_id" per line) into a set"""
+        try:
+            with open(DOWNLOAD_ARCHIVE, encoding='utf-8') as f:
+                return {line.strip() for line in f}
+        except FileNotFoundError:
+            return set()
+    
+    def _tag_downloads(self, downloaded: List[Tuple[Track, YouTubeCandidate, Path]]):
+        """Write ID3 tags for finished downloads in one pass, off the download workers"""
+        
+        def tag_single(download):
+            track, candidate, final_path = download
+            self._add_metadata(final_path, track, candidate)
+        
+        # Tag writes are small file I/O, so a wider pool than downloads is fine
+        with ThreadPoolExecutor(max_workers=TAG_WORKERS) as executor:
+            list(executor.map(tag_single, downloaded))
     
     def _add_metadata(self, file_path: Path, track: Track, youtube_candidate: YouTubeCandidate):
         """Add ID3 metadata to the downloaded file"""
+        if file_path.suffix != '.mp3':
+            logger.debug("Skipping ID3 tags for non-MP3 file: %s", file_path.name)
+            return
+        
         try:
             audiofile = eyed3.load(str(file_path))
             if audiofile and audiofile.tag:
@@ -729,7 +1197,7 @@ class DownloadManager:
                 audiofile.tag.album = track.album
                 audiofile.tag.comments.set(f"Downloaded from: {youtube_candidate.channel_name}")
                 audiofile.tag.save()
-                logger.debug(f"✅ Added metadata to: {file_path.name}")
+                logger.debug("✅ Added metadata to: %s", file_path.name)
         except Exception as e:
             logger.warning(f"⚠️ Failed to add metadata to {file_path}: {e}")
     
@@ -742,6 +1210,7 @@ Generated: {time.strftime('%Y-%m-%d %H:%M:%S')}
 ## Summary
 - **Successful Downloads**: {len(self.successful_downloads)}
 - **Failed Downloads**: {len(self.failed_downloads)}
+- **Already Archived**: {len(self.archived_video_ids)}
 - **Download Directory**: {DOWNLOAD_DIR}
 
 ## Successful Downloads
@@ -795,17 +1264,71 @@ class MusicSyncOrchestrator:
         
         # Remove duplicates from Spotify
         unique_spotify_tracks = self._deduplicate_tracks(spotify_tracks)
+        
+        # Tracks already on disk need no search, scoring or download
+        downloaded_names = self.downloader.downloaded_names()
+        pending_tracks = [t for t in unique_spotify_tracks if safe_filename(f"{t.artist} - {t.name}") not in downloaded_names]
+        already_downloaded = len(unique_spotify_tracks) - len(pending_tracks)
+        if already_downloaded:
+            logger.info(f"⏭️ Skipping {already_downloaded} tracks already downloaded")
+        unique_spotify_tracks = pending_tracks
         logger.info(f"📊 Processing {len(unique_spotify_tracks)} unique Spotify tracks")
         
-        # Step 2: Process each track
+        # Step 2: Find YouTube candidates (pure network I/O, so search concurrently)
+        with ThreadPoolExecutor(max_workers=SEARCH_WORKERS) as executor:
+            all_candidates = list(executor.map(self.ytmusic.search_candidates, unique_spotify_tracks))
+        
+        # Step 3: Score candidates with AI, several tracks per Ollama call
+        use_ai = self.ollama.is_available()
+        all_ai_matches = [None] * len(unique_spotify_tracks)
+        
+        if use_ai:
+            pending = []
+            fuzzy_accepted = fuzzy_rejected = 0
+            for i, (track, candidates) in enumerate(zip(unique_spotify_tracks, all_candidates)):
+                if not candidates:
+                    continue
+                
+                # No candidate is textually close, so no shortcut may accept one
+                fuzzy_match, fuzzy_score = self._fuzzy_match(track, candidates)
+                if fuzzy_score < FUZZY_REJECT_SCORE:
+                    all_ai_matches[i] = []
+                    fuzzy_rejected += 1
+                    continue
+                
+                direct_match = self._direct_match(track, candidates)
+                if direct_match:
+                    all_ai_matches[i] = [(direct_match, 1.0)]
+                    continue
+                
+                # Only send the ambiguous band to Ollama
+                if fuzzy_score >= FUZZY_ACCEPT_SCORE:
+                    all_ai_matches[i] = [(fuzzy_match, fuzzy_score / 100)]
+                    fuzzy_accepted += 1
+                else:
+                    pending.append(i)
+            
+            logger.info(f"⚡ Fuzzy pre-filter: {fuzzy_accepted} matched, {fuzzy_rejected} rejected, {len(pending)} sent to AI")
+            
+            batches = [pending[start:start + SIMILARITY_BATCH_SIZE] for start in range(0, len(pending), SIMILARITY_BATCH_SIZE)]
+            
+            def score_batch(batch):
+                return self.ollama.analyze_song_similarity_batch(
+                    [(unique_spotify_tracks[i], self._filter_by_duration(unique_spotify_tracks[i], all_candidates[i])) for i in batch]
+                )
+            
+            # Keep as many batches in flight as the Ollama server decodes in parallel
+            with ThreadPoolExecutor(max_workers=OLLAMA_PARALLEL) as executor:
+                for batch, batch_matches in zip(batches, executor.map(score_batch, batches)):
+                    for i, ai_matches in zip(batch, batch_matches):
+                        all_ai_matches[i] = ai_matches
+        
+        # Pick the best candidate for each track
         matches_found = []
         no_matches = []
         
-        for i, track in enumerate(unique_spotify_tracks, 1):
-            logger.info(f"🔍 Processing {i}/{len(unique_spotify_tracks)}: {track}")
-            
-            # Find YouTube candidates
-            candidates = self.ytmusic.search_candidates(track)
+        for i, (track, candidates, ai_matches) in enumerate(zip(unique_spotify_tracks, all_candidates, all_ai_matches), 1):
+            logger.debug("🔍 Processing %d/%d: %s", i, len(unique_spotify_tracks), track)
             
             if not candidates:
                 logger.warning(f"⚠️ No YouTube candidates found for: {track}")
@@ -813,13 +1336,11 @@ class MusicSyncOrchestrator:
                 continue
             
             # Use AI to find the best match
-            if self.ollama.is_available():
-                ai_matches = self.ollama.analyze_song_similarity(track, candidates)
-                
+            if use_ai:
                 if ai_matches and ai_matches[0][1] >= SIMILARITY_THRESHOLD:
                     best_candidate = ai_matches[0][0]
                     similarity_score = ai_matches[0][1]
-                    logger.info(f"🤖 AI Match found (similarity: {similarity_score:.2f}): {best_candidate}")
+                    logger.debug("🤖 AI Match found (similarity: %.2f): %s", similarity_score, best_candidate)
                     matches_found.append((track, best_candidate, similarity_score))
                 else:
                     logger.warning(f"🤖 AI similarity too low for: {track}")
@@ -827,20 +1348,17 @@ class MusicSyncOrchestrator:
             else:
                 # Fallback to quality-based selection
                 best_candidate = candidates[0]  # Already sorted by quality score
-                logger.info(f"🎯 Quality-based match: {best_candidate} (score: {best_candidate.quality_score:.1f})")
+                logger.debug("🎯 Quality-based match: %s (score: %.1f)", best_candidate, best_candidate.quality_score)
                 matches_found.append((track, best_candidate, 0.8))  # Assume reasonable similarity
-            
-            # Small delay to be respectful to APIs
-            time.sleep(0.5)
         
         logger.info(f"✅ Found {len(matches_found)} matches, {len(no_matches)} without matches")
         
-        # Step 3: Download matched tracks
+        # Step 4: Download matched tracks
         if matches_found:
             logger.info("⬇️ Starting downloads...")
-            self._download_matches(matches_found)
+            self.downloader.download_all([(track, candidate) for track, candidate, _ in matches_found])
         
-        # Step 4: Generate report
+        # Step 5: Generate report
         report = self.downloader.generate_report()
         
         # Save report to file
@@ -851,6 +1369,7 @@ class MusicSyncOrchestrator:
         logger.info(f"📋 Report saved to: {report_path}")
         
         return {
+            'already_downloaded': already_downloaded,
             'matches_found': len(matches_found),
             'no_matches': len(no_matches),
             'successful_downloads': len(self.downloader.successful_downloads),
@@ -858,49 +1377,60 @@ class MusicSyncOrchestrator:
             'report_path': str(report_path)
         }
     
+    def _direct_match(self, track: Track, candidates: List[YouTubeCandidate]) -> Optional[YouTubeCandidate]:
+        """A candidate that clearly wins on quality or duration needs no AI confirmation"""
+        # Candidates are sorted by quality score, so the leader is first. Quality has
+        # no title term, so a popular upload of a different song must not win on it alone
+        runner_up_score = candidates[1].quality_score if len(candidates) > 1 else 0
+        if (candidates[0].quality_score >= LLM_MIN_QUALITY
+                and candidates[0].quality_score - runner_up_score > LLM_CONFIDENCE_GAP
+                and self._text_score(track, candidates[0]) >= FUZZY_ACCEPT_SCORE):
+            return candidates[0]
+        
+        if track.duration_ms <= 0:
+            return None
+        
+        track_seconds = track.duration_ms // 1000
+        for candidate in candidates:
+            # Song results count as official for any single-artist upload, so the text must agree too
+            if (candidate.is_official
+                    and abs(candidate.duration_seconds - track_seconds) <= EXACT_DURATION_SECONDS
+                    and self._text_score(track, candidate) >= FUZZY_ACCEPT_SCORE):
+                return candidate
+        return None
+    
+    def _text_score(self, track: Track, candidate: YouTubeCandidate) -> float:
+        """WRatio of a candidate's "artist title" against the track's, 0-100"""
+        return fuzz.WRatio(f"{track.artist_lower} {track.name_lower}", f"{candidate.artist_lower} {candidate.title_lower}")
+    
+    def _fuzzy_match(self, track: Track, candidates: List[YouTubeCandidate]) -> Tuple[YouTubeCandidate, float]:
+        """Best candidate by WRatio on "artist title" and its 0-100 score"""
+        _, score, index = process.extractOne(
+            f"{track.artist_lower} {track.name_lower}",
+            [f"{c.artist_lower} {c.title_lower}" for c in candidates],
+            scorer=fuzz.WRatio
+        )
+        return candidates[index], score
+    
+    def _filter_by_duration(self, track: Track, candidates: List[YouTubeCandidate]) -> List[YouTubeCandidate]:
+        """Drop candidates whose length is clearly a different version, if any are close"""
+        if track.duration_ms <= 0:
+            return candidates
+        
+        track_seconds = track.duration_ms // 1000
+        close = [c for c in candidates if abs(c.duration_seconds - track_seconds) <= DURATION_TOLERANCE_SECONDS]
+        return close or candidates
+    
     def _deduplicate_tracks(self, tracks: List[Track]) -> List[Track]:
         """Remove duplicate tracks based on name and artist"""
-        seen = set()
-        unique_tracks = []
-        
+        # setdefault keeps the first occurrence in insertion order
+        unique = {}
         for track in tracks:
-            # Create a signature for deduplication
-            signature = f"{track.name.lower().strip()}|{track.artist.lower().strip()}"
-            
-            if signature not in seen:
-                seen.add(signature)
-                unique_tracks.append(track)
+            unique.setdefault(track.signature, track)
+        unique_tracks = list(unique.values())
         
         logger.info(f"🔄 Deduplicated {len(tracks)} -> {len(unique_tracks)} tracks")
         return unique_tracks
-    
-    def _download_matches(self, matches: List[Tuple[Track, YouTubeCandidate, float]]):
-        """Download all matched tracks with threading"""
-        
-        def download_single_match(match_data):
-            track, candidate, similarity = match_data
-            try:
-                success = self.downloader.download_track(track, candidate)
-                return success
-            except Exception as e:
-                logger.error(f"❌ Unexpected error downloading {track}: {e}")
-                return False
-        
-        # Use ThreadPoolExecutor for concurrent downloads
-        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-            future_to_match = {executor.submit(download_single_match, match): match for match in matches}
-            
-            for future in as_completed(future_to_match):
-                match = future_to_match[future]
-                track = match[0]
-                try:
-                    success = future.result()
-                    if success:
-                        logger.info(f"✅ Completed: {track}")
-                    else:
-                        logger.warning(f"⚠️ Failed: {track}")
-                except Exception as e:
-                    logger.error(f"❌ Thread error for {track}: {e}")
 
 # Initialize orchestrator
 sync_orchestrator = MusicSyncOrchestrator()
@@ -964,17 +1494,13 @@ def analyze_spotify_library_sample(sample_size: int = 5):
         print("❌ Please authenticate with Spotify first!")
         return
     
-    # Get a sample of liked songs
-    liked_songs = spotify_manager.get_liked_songs()
+    # Fetch only the sampled liked songs rather than the whole library
+    sample_tracks = spotify_manager.sample_liked_songs(sample_size)
     
-    if not liked_songs:
+    if not sample_tracks:
         print("❌ No liked songs found!")
         return
     
-    # Take a sample
-    import random
-    sample_tracks = random.sample(liked_songs, min(sample_size, len(liked_songs)))
-    
     for i, track in enumerate(sample_tracks, 1):
         print(f"\n**Track {i}/{len(sample_tracks)}:**")
         print(f"  🎵 Name: {track.name}")
@@ -1082,7 +1608,7 @@ def check_dependencies():
         'yt_dlp': 'YouTube downloader',
         'eyed3': 'Audio metadata editor',
         'requests': 'HTTP client',
-        'pandas': 'Data analysis'
+        'rapidfuzz': 'Fuzzy string matching'
     }
     
     print("📦 Checking dependencies...")
@@ -1150,6 +1676,7 @@ def run_music_sync(include_liked=True, include_playlists=False, dry_run=False):
             
             print("\n🎉 SYNC COMPLETED!")
             print("=" * 30)
+            print(f"⏭️ Already downloaded: {results['already_downloaded']}")
             print(f"📊 Matches found: {results['matches_found']}")
             print(f"✅ Successful downloads: {results['successful_downloads']}")
             print(f"❌ Failed downloads: {results['failed_downloads']}")
@@ -1204,9 +1731,10 @@ def download_single_track(track_name: str, artist_name: str, force_download=Fals
     
     # Check if already downloaded
     safe_name = safe_filename(f"{artist_name} - {track_name}")
-    potential_file = DOWNLOAD_DIR / f"{safe_name}.mp3"
+    existing = [DOWNLOAD_DIR / f"{safe_name}{ext}" for ext in FINISHED_EXTENSIONS]
+    potential_file = next((path for path in existing if path.exists()), None)
     
-    if potential_file.exists() and not force_download:
+    if potential_file and not force_download:
         print(f"✅ File already exists: {potential_file}")
         print("Use force_download=True to re-download")
         return
@@ -1236,18 +1764,23 @@ def download_single_track(track_name: str, artist_name: str, force_download=Fals
         best_candidate = candidates[0]
         print(f"\n🎯 Quality-based selection: {best_candidate.title}")
     
-    # Download
-    success = download_manager.download_track(track, best_candidate)
+    # Download (forcing bypasses the archive so the video is fetched again)
+    success = download_manager.download_track(track, best_candidate, use_archive=not force_download)
     
     if success:
         print(f"✅ Successfully downloaded: {track}")
+    elif best_candidate.video_id in download_manager.archived_video_ids:
+        print(f"⏭️ Already in the download archive: {track}")
+        print("Use force_download=True to re-download")
     else:
         print(f"❌ Download failed: {track}")
 
 def list_downloaded_files():
     """List all downloaded music files"""
     
-    music_files = list(DOWNLOAD_DIR.glob("*.mp3"))
+    # One directory read; DirEntry carries the type and stat info we need
+    with os.scandir(DOWNLOAD_DIR) as entries:
+        music_files = [entry for entry in entries if entry.is_file() and entry.name.endswith(AUDIO_EXTENSIONS)]
     
     print(f"🎵 Downloaded Music Files ({len(music_files)} total)")
     print("=" * 50)
@@ -1256,26 +1789,26 @@ def list_downloaded_files():
         print("No music files found in download directory")
         return
     
-    for file_path in sorted(music_files):
-        file_size = file_path.stat().st_size / (1024 * 1024)  # MB
-        print(f"🎵 {file_path.name} ({file_size:.1f} MB)")
+    for entry in sorted(music_files, key=lambda e: e.name):
+        file_size = entry.stat().st_size / (1024 * 1024)  # MB
+        print(f"🎵 {entry.name} ({file_size:.1f} MB)")
 
 def cleanup_downloads():
     """Clean up partial or failed downloads"""
     
     print("🧹 Cleaning up download directory...")
     
-    # Remove .part files (incomplete downloads)
-    part_files = list(DOWNLOAD_DIR.glob("*.part"))
-    for file_path in part_files:
-        file_path.unlink()
-        print(f"🗑️ Removed partial file: {file_path.name}")
-    
-    # Remove .temp files
-    temp_files = list(DOWNLOAD_DIR.glob("*.temp"))
-    for file_path in temp_files:
-        file_path.unlink()
-        print(f"🗑️ Removed temp file: {file_path.name}")
+    # Remove .part (incomplete downloads) and .temp files in a single pass
+    with os.scandir(DOWNLOAD_DIR) as entries:
+        for entry in entries:
+            if not entry.is_file():
+                continue
+            if entry.name.endswith(".part"):
+                os.unlink(entry.path)
+                print(f"🗑️ Removed partial file: {entry.name}")
+            elif entry.name.endswith(".temp"):
+                os.unlink(entry.path)
+                print(f"🗑️ Removed temp file: {entry.name}")
     
     print("✅ Cleanup complete!")
 
@@ -1294,21 +1827,25 @@ def export_spotify_library_to_csv():
     
     all_tracks = liked_songs + playlist_tracks
     
-    # Convert to DataFrame
-    track_data = [track.to_dict() for track in all_tracks]
-    df = pd.DataFrame(track_data)
-    
-    # Save to CSV
+    # Stream rows to CSV, gathering the stats in the same pass
     csv_path = Path("spotify_library.csv")
-    df.to_csv(csv_path, index=False)
+    unique_tracks = set()
+    artist_counts = Counter()
+    with open(csv_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=[track_field.name for track_field in fields(Track) if track_field.init])
+        writer.writeheader()
+        for track in all_tracks:
+            writer.writerow(track.to_dict())
+            unique_tracks.add((track.name, track.artist))
+            artist_counts[track.artist] += 1
     
     print(f"✅ Exported {len(all_tracks)} tracks to: {csv_path}")
     
     # Show some stats
     print(f"\n📈 Library Statistics:")
     print(f"Total tracks: {len(all_tracks)}")
-    print(f"Unique tracks: {df.drop_duplicates(['name', 'artist']).shape[0]}")
-    print(f"Most common artist: {df['artist'].mode().iloc[0] if not df.empty else 'N/A'}")
+    print(f"Unique tracks: {len(unique_tracks)}")
+    print(f"Most common artist: {artist_counts.most_common(1)[0][0] if artist_counts else 'N/A'}")
 
 print("🛠️ Manual operation functions ready!")
 print("\nAvailable functions:")